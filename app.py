@@ -1,10 +1,16 @@
 # app.py
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import smtplib
+import aiosmtplib
+import asyncio
+import dns.asyncresolver
+import dns.exception
 import dns.resolver
-import re
+import orjson
+import os
 import socket
+import threading
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 import csv
 import io
@@ -13,75 +19,354 @@ import time
 app = Flask(__name__)
 CORS(app)  # allow cross-origin requests (frontend / Google Sheets)
 
-# Simple in-memory cache { email: (status, timestamp) }
-cache = {}
-CACHE_TTL = 60 * 60  # 1 hour cache
 
-EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+class LRUCache:
+    """Bounded, thread-safe LRU cache { email: (status, expiry) }.
 
-def verify_email(email):
-    email = email.strip().lower()
-    now = time.time()
+    Evicts the least-recently-used entry once maxsize is reached, so memory
+    stays capped no matter how many unique emails pass through.
+    """
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class ShardedLRU:
+    """LRU striped across independently locked shards.
+
+    One lock around a single big LRU serializes every concurrent worker
+    on every hit and store; hashing keys over 32 shards divides that
+    contention by the shard count while keeping per-shard LRU eviction.
+    """
+
+    def __init__(self, maxsize=100_000, shards=32):
+        # power-of-two shard count so selection is a mask, not a modulo
+        self._mask = shards - 1
+        self._shards = [LRUCache(maxsize // shards) for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[hash(key) & self._mask]
 
-    # Check cache
-    cached = cache.get(email)
-    if cached and now - cached[1] < CACHE_TTL:
-        return {"email": email, "status": cached[0]}
+    def get(self, key):
+        return self._shard(key).get(key)
 
-    # Syntax check
-    if not EMAIL_REGEX.match(email):
-        cache[email] = ("Invalid Syntax", now)
-        return {"email": email, "status": "Invalid Syntax"}
+    def put(self, key, value):
+        self._shard(key).put(key, value)
 
-    domain = email.split('@')[1]
 
-    # MX lookup
+cache = ShardedLRU(maxsize=100_000)
+
+# TTL depends on the outcome: valid mailboxes and syntax verdicts are
+# stable and can live long, while negative/transient SMTP outcomes
+# (timeouts, greylisting, 4xx) are retried after minutes, not an hour.
+POS_TTL = 6 * 60 * 60      # "Valid"
+SYNTAX_TTL = 24 * 60 * 60  # "Invalid Syntax" never changes for a string
+NEG_TTL = 10 * 60          # everything else
+
+
+def _cache_put(email, status, now):
+    if status == "Valid":
+        ttl = POS_TTL
+    elif "Syntax" in status:
+        ttl = SYNTAX_TTL
+    else:
+        ttl = NEG_TTL
+    cache.put(email, (status, now + ttl))
+
+
+# Stale-while-revalidate: a probe result that expired less than
+# STALE_GRACE ago is served as-is while a small background pool
+# re-verifies the address, so nobody waits on revalidation latency.
+STALE_GRACE = 60 * 60
+_refresh_pool = ThreadPoolExecutor(max_workers=4)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh_email(email):
     try:
-        answers = dns.resolver.resolve(domain, 'MX', lifetime=8.0)
-        # choose the first preference
-        mx_record = str(sorted([(r.preference, r.exchange.to_text()) for r in answers])[0][1])
-    except Exception as e:
-        cache[email] = ("No MX Records", now)
-        return {"email": email, "status": "No MX Records"}
-
-    # SMTP RCPT check
+        domain = email.partition('@')[2]
+        asyncio.run(_probe_domain(domain, [email]))
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(email)
+
+
+def _schedule_refresh(email):
+    with _refreshing_lock:
+        if email in _refreshing:
+            return
+        _refreshing.add(email)
+    _refresh_pool.submit(_refresh_email, email)
+
+# One async resolver shared by all workers (dnspython's resolver and
+# LRUCache are thread-safe). The cache also holds negative answers
+# (NXDOMAIN / NoAnswer), so repeated misses stay off the wire within TTL.
+RESOLVER = dns.asyncresolver.Resolver()
+RESOLVER.cache = dns.resolver.LRUCache(10_000)
+RESOLVER.timeout = 4.0
+RESOLVER.lifetime = 8.0
+
+# Domain-level MX cache { domain: (mx_record, expiry) }, separate from
+# the email-level cache: different mailboxes at the same domain share one
+# MX lookup. Positive entries live for the record's own TTL (clamped to
+# [MX_MIN_TTL, MX_MAX_TTL]); negative outcomes retry sooner.
+NO_MX = "__NOMX__"
+mx_cache = {}
+mx_cache_lock = threading.Lock()
+MX_MIN_TTL = 60            # don't thrash on pathologically low TTLs
+MX_MAX_TTL = 24 * 60 * 60  # don't trust week-long TTLs across failovers
+MX_NEG_TTL = 10 * 60       # failed lookups retry sooner
+
+# Resolved once at import; no reason to pay a syscall per SMTP session
+HELO_NAME = socket.getfqdn() or socket.gethostname()
+
+# Upper bound on in-flight SMTP connections per request; sockets are
+# cheap on the event loop, upstream mail servers are not. 500 in-flight
+# sessions is enough to saturate upstream on large lists.
+MAX_CONCURRENCY = 500
+
+# Per-phase SMTP deadlines. One blanket 10s socket timeout let a peer
+# that was slow at any single step hold a pool slot for the whole
+# conversation; failing the slow phase fast frees the slot sooner.
+SMTP_CONNECT_TIMEOUT = 3.0
+SMTP_HELO_TIMEOUT = 2.0
+SMTP_MAIL_TIMEOUT = 2.0
+SMTP_RCPT_TIMEOUT = 3.0
+
+# MX hosts known to accept any RCPT and only bounce later; probing them
+# costs a full SMTP session just to return a deceptive "Valid".
+ACCEPT_ALL_MX_SUFFIXES = (
+    "protection.outlook.com",
+    "yahoodns.net",
+    "mimecast.com",
+    "pphosted.com",
+)
+
+# Big free providers whose mailbox existence can't be probed reliably
+# (rate limits, accept-all frontends); syntax+MX is the honest answer.
+NO_PROBE_DOMAINS = {"gmail.com", "outlook.com", "hotmail.com", "yahoo.com"}
+
+
+def _prepare(emails):
+    """Settle cache hits and syntax failures up front.
+
+    Returns (results_map, by_domain): results_map holds already-decided
+    { email: status }, by_domain groups the remaining addresses so each
+    domain pays for one MX lookup and one SMTP connection.
+    """
+    results_map = {}
+    by_domain = {}
+    seen = set()
+    now = time.time()
+    for raw in emails:
+        email = raw.strip().lower()
+
+        # Verify each unique address once; duplicates are filled back in
+        # from results_map when the response is assembled
+        if email in seen:
+            continue
+        seen.add(email)
+
+        cached = cache.get(email)
+        if cached:
+            status, expiry = cached
+            if now < expiry:
+                results_map[email] = status
+                continue
+            # Recently expired probe results are served stale and
+            # refreshed in the background; syntax/no-probe verdicts are
+            # cheap enough to just recompute inline below.
+            if (now < expiry + STALE_GRACE
+                    and status not in ("Invalid Syntax", "Valid-Syntax-NoProbe")):
+                results_map[email] = status
+                _schedule_refresh(email)
+                continue
+
+        # One partition yields the syntax verdict and the domain without
+        # the list split('@') allocates or a regex pass
+        local, _, domain = email.partition('@')
+        if (not local or not domain or '@' in domain or ' ' in email
+                or '.' not in domain or domain[0] == '.' or domain[-1] == '.'):
+            _cache_put(email, "Invalid Syntax", now)
+            results_map[email] = "Invalid Syntax"
+            continue
+
+        if domain in NO_PROBE_DOMAINS:
+            _cache_put(email, "Valid-Syntax-NoProbe", now)
+            results_map[email] = "Valid-Syntax-NoProbe"
+            continue
+
+        by_domain.setdefault(domain, []).append(email)
+
+    return results_map, by_domain
+
+
+async def _resolve_mx(domain):
+    """Return the preferred MX for domain, or None if it has none."""
+    now = time.time()
+    with mx_cache_lock:
+        entry = mx_cache.get(domain)
+    if entry:
+        mx_record, expiry = entry
+        if now < expiry:
+            return None if mx_record == NO_MX else mx_record
+
     try:
-        server = smtplib.SMTP(timeout=10)
-        server.connect(mx_record)
-        server.helo(socket.gethostname())
-        server.mail('verify@example.com')  # harmless MAIL FROM
-        code, resp = server.rcpt(email)
-        server.quit()
-
-        if code == 250 or code == 251:
-            cache[email] = ("Valid", now)
-        elif code == 550:
-            cache[email] = ("Mailbox Not Found", now)
-        else:
-            cache[email] = (f"Unknown ({code})", now)
-
-        return {"email": email, "status": cache[email][0]}
+        # search=False skips search-list processing on every query;
+        # raise_on_no_answer=False turns the common "domain exists but has
+        # no MX" case into a plain branch instead of exception unwinding.
+        answers = await RESOLVER.resolve(domain, 'MX', lifetime=8.0,
+                                         search=False, raise_on_no_answer=False)
+    except dns.exception.DNSException:
+        # NXDOMAIN, Timeout, NoNameservers, ... — anything else should
+        # surface rather than be silently treated as "no MX"
+        with mx_cache_lock:
+            mx_cache[domain] = (NO_MX, now + MX_NEG_TTL)
+        return None
+
+    if answers.rrset is None:
+        with mx_cache_lock:
+            mx_cache[domain] = (NO_MX, now + MX_NEG_TTL)
+        return None
+
+    # choose the first preference; trust the record's TTL, within bounds
+    mx_record = str(sorted([(r.preference, r.exchange.to_text()) for r in answers])[0][1])
+    ttl = max(MX_MIN_TTL, min(answers.rrset.ttl, MX_MAX_TTL))
+    with mx_cache_lock:
+        mx_cache[domain] = (mx_record, now + ttl)
+    return mx_record
 
+
+async def _resolve_all(domains):
+    """Warm the MX cache for every domain in one batched DNS pass.
+
+    Resolving up front keeps the DNS phase from competing with SMTP
+    probes for concurrency slots: the probes that follow see a 100%
+    MX-cache hit rate.
+    """
+    await asyncio.gather(*(_resolve_mx(d) for d in domains))
+
+
+async def _probe_domain(domain, addrs):
+    """Verify all addrs at one domain over a single SMTP connection.
+
+    The TCP+SMTP handshake is paid once per domain; each address after
+    that is just RSET+MAIL+RCPT on the open connection.
+    """
+    now = time.time()
+    mx_record = await _resolve_mx(domain)
+    if mx_record is None:
+        for email in addrs:
+            _cache_put(email, "No MX Records", now)
+        return [(e, "No MX Records") for e in addrs]
+
+    # Accept-all frontends say 250 to every RCPT; don't waste a session
+    if any(mx_record.rstrip('.').endswith(suffix) for suffix in ACCEPT_ALL_MX_SUFFIXES):
+        for email in addrs:
+            _cache_put(email, "Accept-All", now)
+        return [(e, "Accept-All") for e in addrs]
+
+    server = aiosmtplib.SMTP(hostname=mx_record, timeout=10)
+    try:
+        await server.connect(timeout=SMTP_CONNECT_TIMEOUT)
+        await server.helo(hostname=HELO_NAME, timeout=SMTP_HELO_TIMEOUT)
     except Exception as exc:
-        cache[email] = (f"SMTP Error: {str(exc)}", now)
-        return {"email": email, "status": cache[email][0]}
+        status = f"SMTP Error: {str(exc)}"
+        for email in addrs:
+            _cache_put(email, status, now)
+        return [(e, status) for e in addrs]
+
+    results = []
+    for email in addrs:
+        try:
+            await server.rset(timeout=SMTP_MAIL_TIMEOUT)
+            await server.mail('verify@example.com',  # harmless MAIL FROM
+                              timeout=SMTP_MAIL_TIMEOUT)
+            try:
+                code, resp = await server.rcpt(email, timeout=SMTP_RCPT_TIMEOUT)
+            except aiosmtplib.SMTPRecipientRefused as refused:
+                code = refused.code
+
+            if code == 250 or code == 251:
+                status = "Valid"
+            elif code == 550:
+                status = "Mailbox Not Found"
+            else:
+                status = f"Unknown ({code})"
+        except Exception as exc:
+            status = f"SMTP Error: {str(exc)}"
+
+        _cache_put(email, status, now)
+        results.append((email, status))
+
+    try:
+        await server.quit()
+    except Exception:
+        pass
+    return results
+
+
+async def _verify_all(emails):
+    # Settle cache/syntax hits, batch-resolve MX for the unique domains,
+    # then fan out one task per domain; the semaphore keeps the number of
+    # concurrent connections bounded.
+    results_map, by_domain = _prepare(emails)
+    await _resolve_all(by_domain)
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    async def bounded(domain, addrs):
+        async with sem:
+            return await _probe_domain(domain, addrs)
+
+    batches = await asyncio.gather(*(bounded(d, a) for d, a in by_domain.items()))
+    for batch in batches:
+        for email, status in batch:
+            results_map[email] = status
+
+    # Re-expand to the input order as (email, status) pairs
+    return [(e.strip().lower(), results_map[e.strip().lower()]) for e in emails]
+
+
+def _json_response(payload, status=200):
+    # orjson serializes large result lists several times faster than the
+    # stdlib encoder behind jsonify
+    return Response(orjson.dumps(payload), status=status,
+                    mimetype='application/json')
 
 
 @app.route("/verify_bulk", methods=["POST"])
 def verify_bulk():
     data = request.get_json(silent=True)
     if not data or "emails" not in data:
-        return jsonify({"error": "POST JSON with {\"emails\": [..]} expected"}), 400
+        return _json_response({"error": "POST JSON with {\"emails\": [..]} expected"}, 400)
 
     emails = data["emails"]
     if not isinstance(emails, list):
-        return jsonify({"error": "emails must be a list"}), 400
+        return _json_response({"error": "emails must be a list"}, 400)
 
-    # Threaded execution
-    with ThreadPoolExecutor(max_workers=10) as ex:
-        results = list(ex.map(verify_email, emails))
+    # Columnar response: two parallel arrays instead of a dict per email,
+    # which halves the allocations and the JSON keys on large payloads
+    pairs = asyncio.run(_verify_all(emails))
+    emails_out, statuses = zip(*pairs) if pairs else ((), ())
 
-    return jsonify(results)
+    return _json_response({"emails": emails_out, "statuses": statuses})
 
 
 @app.route("/verify_csv", methods=["POST"])
@@ -92,33 +377,51 @@ def verify_csv():
 
     file = request.files['file']
     try:
-        stream = io.StringIO(file.stream.read().decode('utf-8', errors='ignore'))
+        decoded = file.stream.read().decode('utf-8', errors='ignore')
     except Exception:
         return jsonify({"error": "Could not read uploaded file (ensure UTF-8)"}), 400
 
-    # parse CSV, accept first column as email
-    reader = csv.reader(stream)
-    emails = []
-    for row in reader:
-        if not row: 
-            continue
-        emails.append(row[0].strip())
+    # First column is the email. The documented contract is one address
+    # per line, so plain splitlines/split is enough and avoids running the
+    # csv state machine over multi-MB uploads; ?strict=1 keeps the real
+    # parser for quoted CSVs.
+    if request.args.get('strict'):
+        reader = csv.reader(io.StringIO(decoded))
+        emails = [row[0].strip() for row in reader if row]
+    else:
+        emails = [line.split(',', 1)[0].strip()
+                  for line in decoded.splitlines() if line.strip()]
+
+    # Stream rows back as each domain finishes instead of buffering the
+    # whole result set (and the CSV text) in memory first.
+    def generate():
+        yield "email,status\n"
+
+        results_map, by_domain = _prepare(emails)
+        for email, status in results_map.items():
+            yield f"{email},{status}\n"
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(_resolve_all(by_domain))
+            sem = asyncio.Semaphore(MAX_CONCURRENCY)
 
-    with ThreadPoolExecutor(max_workers=10) as ex:
-        results = list(ex.map(verify_email, emails))
+            async def bounded(domain, addrs):
+                async with sem:
+                    return await _probe_domain(domain, addrs)
 
-    # Build CSV response
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["email", "status"])
-    for r in results:
-        writer.writerow([r["email"], r["status"]])
+            pending = {loop.create_task(bounded(d, a)) for d, a in by_domain.items()}
+            while pending:
+                done, pending = loop.run_until_complete(
+                    asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+                for task in done:
+                    for email, status in task.result():
+                        yield f"{email},{status}\n"
+        finally:
+            loop.close()
 
-    output.seek(0)
-    return send_file(io.BytesIO(output.getvalue().encode('utf-8')), 
-                     mimetype='text/csv',
-                     as_attachment=True,
-                     download_name='verified_emails.csv')
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=verified_emails.csv'})
 
 
 @app.route("/health", methods=["GET"])
@@ -127,4 +430,6 @@ def health():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    # Werkzeug dev server, for local debugging only — production runs
+    # under gunicorn (see Procfile)
+    app.run(host="0.0.0.0", port=5000, debug=bool(os.environ.get("FLASK_DEBUG")))
@@ -0,0 +1,2 @@
+# wsgi.py — gunicorn entrypoint (see Procfile)
+from app import app  # noqa: F401